@@ -3,11 +3,14 @@ from __future__ import annotations
 import json
 import os
 import secrets
+from datetime import date, timedelta
 from typing import Any
 
 from flask import Flask, Response, jsonify, redirect, render_template, request, session, url_for
+from jinja2 import FileSystemBytecodeCache
 
 from backend.auth import get_selected_user, is_authed, pop_next_url, require_login, require_selected_user
+from backend.backup import init_app as init_backup
 from backend.db import (
     close_db,
     create_duudl,
@@ -16,11 +19,24 @@ from backend.db import (
     fetch_duudl_state_json,
     get_duudl_by_token,
     get_user,
+    get_user_calendar_version,
     list_duudls,
+    list_user_availability,
     list_users,
     update_duudl,
     upsert_response,
 )
+from backend.exports import (
+    VALUE_LABELS,
+    calendar_feed_token,
+    conditional_stream,
+    iter_duudl_csv,
+    iter_user_ics,
+    user_id_from_feed_token,
+)
+from backend.freeze import init_app as init_freeze
+from backend.freeze import invalidate_snapshot
+from backend.profiling import init_app as init_profiler
 
 
 def _template_context() -> dict[str, Any]:
@@ -41,10 +57,33 @@ def _pop_form_state(key: str) -> dict[str, Any]:
     return state if isinstance(state, dict) else {}
 
 
+def _parse_day_range() -> tuple[str, str] | None:
+    """Reads ?from=&to= (YYYY-MM-DD); defaults to today and half a year ahead."""
+    try:
+        day_from = date.fromisoformat(request.args.get("from") or date.today().isoformat())
+        if request.args.get("to"):
+            day_to = date.fromisoformat(request.args["to"])
+        else:
+            day_to = day_from + timedelta(days=182) if day_from <= date.max - timedelta(days=182) else date.max
+    except ValueError:
+        return None
+    return day_from.isoformat(), day_to.isoformat()
+
+
 def create_app() -> Flask:
     app = Flask(__name__)
     app.config["SECRET_KEY"] = _load_secret_key()
     app.config["DATABASE_PATH"] = os.environ.get("DUUDL_DB_PATH", "data/duudl.db")
+    app.config["JINJA_CACHE_DIR"] = os.environ.get(
+        "DUUDL_JINJA_CACHE_DIR", os.path.join(os.path.dirname(app.config["DATABASE_PATH"]), "jinja_cache")
+    )
+    app.config["SCHEMA_READY"] = False
+
+    # Compiled templates survive restarts, so new processes skip the Jinja parse/compile step.
+    os.makedirs(app.config["JINJA_CACHE_DIR"], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["JINJA_CACHE_DIR"])
+    init_profiler(app)
+    init_backup(app)
 
     @app.template_filter("no_month_date")
     def no_month_date(value: str) -> str:
@@ -82,8 +121,12 @@ def create_app() -> Flask:
 
     @app.before_request
     def _ensure_db_schema():
-        ensure_schema()
+        # Once per process; already done in the gunicorn master when the app is preloaded (see warm_up).
+        if not app.config["SCHEMA_READY"]:
+            ensure_schema()
+            app.config["SCHEMA_READY"] = True
 
+    init_freeze(app)
     app.teardown_appcontext(close_db)
 
     @app.get("/healthz")
@@ -144,10 +187,38 @@ def create_app() -> Flask:
     @require_selected_user
     def overview():
         duudls = list_duudls()
+        selected_user = get_selected_user()
+        assert selected_user is not None
+
         return render_template(
             "overview.html",
             title="Oversikt",
             duudls=duudls,
+            calendar_feed_url=url_for(
+                "calendar_feed", feed_token=calendar_feed_token(selected_user.id), _external=True
+            ),
+            **_template_context(),
+        )
+
+    @app.get("/me")
+    @require_selected_user
+    def me():
+        selected_user = get_selected_user()
+        assert selected_user is not None
+
+        day_range = _parse_day_range()
+        if day_range is None:
+            session["flash_error"] = "Ugyldig dato."
+            return redirect(url_for("me"))
+
+        day_from, day_to = day_range
+        return render_template(
+            "me.html",
+            title="Min tilgjengelighet",
+            rows=list_user_availability(selected_user.id, day_from=day_from, day_to=day_to),
+            day_from=day_from,
+            day_to=day_to,
+            value_labels=VALUE_LABELS,
             **_template_context(),
         )
 
@@ -224,6 +295,42 @@ def create_app() -> Flask:
             **_template_context(),
         )
 
+    @app.get("/d/<token>/export.csv")
+    @require_selected_user
+    def export_duudl_csv(token: str):
+        duudl = get_duudl_by_token(token)
+        if duudl is None:
+            return Response("Not found", status=404)
+
+        return conditional_stream(
+            iter_duudl_csv(duudl, list_users()),
+            etag=f"duudl-{duudl.id}-{duudl.revision}",
+            last_modified=duudl.updated_at,
+            mimetype="text/csv",
+            filename=f"duudl-{duudl.token}.csv",
+        )
+
+    @app.get("/calendar/<feed_token>.ics")
+    def calendar_feed(feed_token: str):
+        """
+        Per-user feed of "yes" dates across all Duudls. Authenticated by the signed
+        feed token in the URL, since calendar clients do not carry a login session.
+        """
+        user_id = user_id_from_feed_token(feed_token)
+        user = get_user(user_id) if user_id is not None else None
+        if user is None:
+            return Response("Not found", status=404)
+
+        version = get_user_calendar_version(user.id)
+        assert version is not None
+        revision, last_modified = version
+        return conditional_stream(
+            iter_user_ics(user, last_modified=last_modified),
+            etag=f"ics-{user.id}-{revision}",
+            last_modified=last_modified,
+            mimetype="text/calendar",
+        )
+
     @app.get("/d/<token>/edit")
     @require_selected_user
     def edit_duudl_page(token: str):
@@ -262,6 +369,7 @@ def create_app() -> Flask:
             return redirect(url_for("edit_duudl_page", token=token))
 
         update_duudl(duudl_id=duudl.id, title=title, description=description, new_days=[str(d) for d in days])
+        invalidate_snapshot(app, token)
         return redirect(url_for("show_duudl", token=token))
 
     @app.post("/d/<token>/delete")
@@ -272,6 +380,7 @@ def create_app() -> Flask:
             return Response("Not found", status=404)
 
         delete_duudl(duudl_id=duudl.id)
+        invalidate_snapshot(app, token)
         return redirect(url_for("overview"))
 
     @app.get("/api/duudl/<token>")
@@ -282,6 +391,36 @@ def create_app() -> Flask:
             return Response("Not found", status=404)
         return jsonify(fetch_duudl_state_json(duudl.id))
 
+    @app.get("/api/me/availability")
+    @require_selected_user
+    def api_me_availability():
+        selected_user = get_selected_user()
+        assert selected_user is not None
+
+        day_range = _parse_day_range()
+        if day_range is None:
+            return Response("Bad date", status=400)
+
+        day_from, day_to = day_range
+        rows = list_user_availability(selected_user.id, day_from=day_from, day_to=day_to)
+        return jsonify(
+            {
+                "from": day_from,
+                "to": day_to,
+                "rows": [
+                    {
+                        "day": r.day,
+                        "value": r.value,
+                        "comment": r.comment,
+                        "token": r.token,
+                        "title": r.title,
+                        "conflict": r.conflict,
+                    }
+                    for r in rows
+                ],
+            }
+        )
+
     @app.post("/api/duudl/<token>/response")
     @require_selected_user
     def api_response(token: str):
@@ -307,6 +446,7 @@ def create_app() -> Flask:
             return Response("Bad day", status=400)
 
         upsert_response(duudl_id=duudl.id, user_id=selected_user.id, day=day, value=value, comment=comment)
+        invalidate_snapshot(app, token)
         return jsonify({"ok": True})
 
     @app.post("/api/duudl/<token>/admin-response")
@@ -343,11 +483,25 @@ def create_app() -> Flask:
             return Response("Unknown user", status=400)
 
         upsert_response(duudl_id=duudl.id, user_id=user_id, day=day, value=value, comment=comment)
+        invalidate_snapshot(app, token)
         return jsonify({"ok": True})
 
     return app
 
 
+def warm_up(app: Flask) -> None:
+    """
+    Runs the schema check and compiles every template up front.
+    Called once in the gunicorn master (preload_app), so forked workers inherit
+    a ready schema and Jinja's in-memory template cache.
+    """
+    with app.app_context():
+        ensure_schema()
+        app.config["SCHEMA_READY"] = True
+        for name in app.jinja_env.list_templates(extensions=["html"]):
+            app.jinja_env.get_template(name)
+
+
 def _load_secret_key() -> str:
     explicit = os.environ.get("DUUDL_SECRET_KEY")
     if explicit:
@@ -0,0 +1,445 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Iterator
+
+from flask import Flask, g
+
+from backend.freeze import remove_all_snapshots
+
+SNAPSHOT_PREFIX = "duudl-"
+SNAPSHOT_SUFFIX = ".db"
+WINDOW_FILENAME = ".window"
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class BackupResult:
+    path: str
+    duration_seconds: float
+    pages: int
+    size_bytes: int
+    restarts: int
+
+
+def _snapshot_name() -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    return f"{SNAPSHOT_PREFIX}{stamp}{SNAPSHOT_SUFFIX}"
+
+
+def _check_integrity(conn: sqlite3.Connection) -> None:
+    row = conn.execute("PRAGMA integrity_check").fetchone()
+    if row is None or row[0] != "ok":
+        raise RuntimeError(f"integrity check failed: {row[0] if row else 'no result'}")
+
+
+def _write_window(backup_dir: str, window_id: str, state: str) -> None:
+    """Records the running backup in `backup_dir`, so every worker can tell which requests overlapped it."""
+    path = os.path.join(backup_dir, WINDOW_FILENAME)
+    with open(path + ".partial", "w", encoding="utf-8") as f:
+        f.write(f"{window_id} {state}\n")
+    os.replace(path + ".partial", path)
+
+
+def create_backup(
+    db_path: str,
+    backup_dir: str,
+    *,
+    pages_per_step: int = 64,
+    sleep_seconds: float = 0.01,
+    max_restarts: int = 3,
+) -> BackupResult:
+    """
+    Copies the live database into a new snapshot file in small page steps,
+    sleeping between steps. Each step only holds a read lock briefly, so writers
+    are never blocked for long. The snapshot is integrity checked before it is
+    moved into place.
+
+    SQLite restarts a stepped backup from page 0 whenever another connection writes.
+    After `max_restarts` restarts the rest is copied in one step, so a steady stream
+    of writes cannot keep the backup from finishing.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    name = _snapshot_name()
+    final_path = os.path.join(backup_dir, name)
+    tmp_path = final_path + ".partial"
+
+    started = time.monotonic()
+    pages_copied = 0
+    restarts = 0
+    last_remaining: int | None = None
+
+    def progress(_status: int, remaining: int, total: int) -> None:
+        nonlocal pages_copied, restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        pages_copied = total - remaining
+        # backup()'s own `sleep` only applies after BUSY/LOCKED, so pace the steps here.
+        if remaining > 0:
+            time.sleep(sleep_seconds)
+
+    _write_window(backup_dir, name, "running")
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        try:
+            src.backup(dst, pages=pages_per_step, progress=progress, sleep=sleep_seconds)
+        except _TooManyRestarts:
+            src.backup(dst, pages=-1)
+            pages_copied = dst.execute("PRAGMA page_count").fetchone()[0]
+        _check_integrity(dst)
+    except Exception:
+        dst.close()
+        src.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        _write_window(backup_dir, name, "done")
+    dst.close()
+    src.close()
+
+    os.replace(tmp_path, final_path)
+    return BackupResult(
+        path=final_path,
+        duration_seconds=time.monotonic() - started,
+        pages=pages_copied,
+        size_bytes=os.path.getsize(final_path),
+        restarts=restarts,
+    )
+
+
+@contextmanager
+def backup_lock(backup_dir: str, *, blocking: bool = True) -> Iterator[bool]:
+    """
+    Serializes backup/rotate runs across processes (CLI and every gunicorn worker).
+    Yields False if `blocking` is off and another process holds the lock.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    with open(os.path.join(backup_dir, ".lock"), "w") as lock_file:
+        try:
+            import fcntl
+        except ImportError:
+            yield True
+            return
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def list_snapshots(backup_dir: str) -> list[str]:
+    """Returns snapshot paths (plain and gzipped), newest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    names = [
+        n
+        for n in os.listdir(backup_dir)
+        if n.startswith(SNAPSHOT_PREFIX)
+        and (n.endswith(SNAPSHOT_SUFFIX) or n.endswith(SNAPSHOT_SUFFIX + ".gz"))
+    ]
+    # Timestamped names sort chronologically.
+    names.sort(reverse=True)
+    return [os.path.join(backup_dir, n) for n in names]
+
+
+def rotate_snapshots(backup_dir: str, *, keep: int) -> None:
+    """
+    Keeps the newest snapshot uncompressed (fast restore), gzips the older ones
+    and deletes everything beyond the newest `keep` snapshots.
+    """
+    keep = max(keep, 1)
+    # Leftovers from a run that was interrupted; callers hold the backup lock.
+    for name in os.listdir(backup_dir):
+        if name.endswith(".partial"):
+            os.remove(os.path.join(backup_dir, name))
+
+    snapshots = list_snapshots(backup_dir)
+    for index, path in enumerate(snapshots):
+        if index >= keep:
+            os.remove(path)
+            continue
+        if index == 0 or path.endswith(".gz"):
+            continue
+        with open(path, "rb") as src, gzip.open(path + ".gz.partial", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(path + ".gz.partial", path + ".gz")
+        os.remove(path)
+
+
+def restore_backup(snapshot_path: str, db_path: str, *, frozen_dir: str | None = None) -> None:
+    """
+    Copies a snapshot back into the live database through the backup API,
+    so running workers see a consistent database without being restarted.
+    Frozen Duudl snapshots in `frozen_dir` no longer match the restored data and are removed.
+    """
+    tmp_path: str | None = None
+    source_path = snapshot_path
+    if snapshot_path.endswith(".gz"):
+        fd, tmp_path = tempfile.mkstemp(suffix=SNAPSHOT_SUFFIX)
+        with os.fdopen(fd, "wb") as dst, gzip.open(snapshot_path, "rb") as src:
+            shutil.copyfileobj(src, dst)
+        source_path = tmp_path
+
+    try:
+        src = sqlite3.connect(source_path)
+        try:
+            _check_integrity(src)
+            dst = sqlite3.connect(db_path)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+
+    if frozen_dir is not None:
+        remove_all_snapshots(frozen_dir)
+
+
+class LatencyTracker:
+    """
+    Collects this worker's request latencies, split by whether they overlapped a backup.
+    The backup window is read from `backup_dir`, where whichever process runs the backup
+    (a worker's scheduler or the CLI) records it, so every worker classifies its own
+    requests and reports the latency a backup added once that backup has finished.
+    """
+
+    def __init__(self, backup_dir: str) -> None:
+        self.backup_dir = backup_dir
+        self._lock = threading.Lock()
+        self._window_mtime: int | None = None
+        self._window: tuple[str | None, bool] = (None, False)
+        self._baseline = [0, 0.0]
+        self._during = [0, 0.0]
+        self._last_finished: str | None = None
+
+    def current_window(self) -> tuple[str | None, bool]:
+        """Returns (backup id, running) of the latest backup; re-reads the marker only when it changes."""
+        path = os.path.join(self.backup_dir, WINDOW_FILENAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, False
+        with self._lock:
+            if mtime != self._window_mtime:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        window_id, state = f.read().split()
+                except (OSError, ValueError):
+                    return None, False
+                self._window_mtime = mtime
+                self._window = (window_id, state == "running")
+            return self._window
+
+    def running_window(self) -> str | None:
+        window_id, running = self.current_window()
+        return window_id if running else None
+
+    def record(self, seconds: float, *, overlapped: str | None) -> str | None:
+        """
+        Records one request. Returns a report line the first time this worker sees a
+        backup it has requests for as finished; the totals then start over.
+        """
+        window_id, running = self.current_window()
+        with self._lock:
+            bucket = self._baseline if overlapped is None else self._during
+            bucket[0] += 1
+            bucket[1] += seconds
+
+            if running or window_id is None or window_id == self._last_finished:
+                return None
+            self._last_finished = window_id
+            baseline_count, baseline_total = self._baseline
+            during_count, during_total = self._during
+            self._baseline = [0, 0.0]
+            self._during = [0, 0.0]
+
+        if during_count == 0 or baseline_count == 0:
+            return None
+        during_ms = during_total / during_count * 1000.0
+        baseline_ms = baseline_total / baseline_count * 1000.0
+        return (
+            f"backup {window_id} added {during_ms - baseline_ms:+.1f} ms per request "
+            f"({during_count} requests during, {baseline_count} before)"
+        )
+
+
+def _run_scheduled_backup(app: Flask) -> None:
+    db_path = app.config["DATABASE_PATH"]
+    backup_dir = app.config["BACKUP_DIR"]
+    if not os.path.exists(db_path):
+        return
+
+    # Several gunicorn workers each run a scheduler; only one of them backs up per interval.
+    with backup_lock(backup_dir, blocking=False) as acquired:
+        if not acquired:
+            return
+
+        newest = list_snapshots(backup_dir)
+        if newest:
+            age = time.time() - os.path.getmtime(newest[0])
+            if age < app.config["BACKUP_INTERVAL_SECONDS"] * 0.5:
+                return
+
+        result = create_backup(db_path, backup_dir)
+        rotate_snapshots(backup_dir, keep=app.config["BACKUP_KEEP"])
+
+    app.logger.info(
+        "backup written: %s (%.2fs, %d pages, %d restarts, %d bytes)",
+        result.path,
+        result.duration_seconds,
+        result.pages,
+        result.restarts,
+        result.size_bytes,
+    )
+
+
+def _scheduler_loop(app: Flask) -> None:
+    interval = app.config["BACKUP_INTERVAL_SECONDS"]
+    while True:
+        time.sleep(interval)
+        try:
+            _run_scheduled_backup(app)
+        except Exception:
+            app.logger.exception("scheduled backup failed")
+
+
+def start_scheduler(app: Flask) -> None:
+    """
+    Starts the in-process backup thread for this process.
+    Safe to call repeatedly and after fork; a forked child starts its own thread.
+    """
+    state: dict[str, Any] | None = app.extensions.get("duudl_backup")
+    if state is None or app.config["BACKUP_INTERVAL_SECONDS"] <= 0 or state.get("pid") == os.getpid():
+        return
+    state["pid"] = os.getpid()
+    thread = threading.Thread(target=_scheduler_loop, args=(app,), name="duudl-backup", daemon=True)
+    thread.start()
+
+
+def init_app(app: Flask) -> None:
+    """
+    Registers backup latency tracking, and the backup scheduler when
+    DUUDL_BACKUP_INTERVAL_SECONDS is set. Tracking costs one stat() per request and also
+    covers backups taken with `python -m backend.backup`.
+    """
+    app.config["BACKUP_DIR"] = os.environ.get(
+        "DUUDL_BACKUP_DIR", os.path.join(os.path.dirname(app.config["DATABASE_PATH"]), "backups")
+    )
+    app.config["BACKUP_INTERVAL_SECONDS"] = int(os.environ.get("DUUDL_BACKUP_INTERVAL_SECONDS", "0"))
+    app.config["BACKUP_KEEP"] = int(os.environ.get("DUUDL_BACKUP_KEEP", "14"))
+
+    tracker = LatencyTracker(app.config["BACKUP_DIR"])
+    app.extensions["duudl_backup"] = {"tracker": tracker}
+
+    @app.before_request
+    def _start_backup_timer():
+        # Threads do not survive fork, so the scheduler is started lazily in each worker.
+        start_scheduler(app)
+        g.backup_request_started = time.monotonic()
+        g.backup_request_window = tracker.running_window()
+
+    @app.teardown_request
+    def _record_backup_latency(_exc: BaseException | None = None) -> None:
+        started = g.pop("backup_request_started", None)
+        if started is None:
+            return
+        overlapped = g.pop("backup_request_window", None) or tracker.running_window()
+        report = tracker.record(time.monotonic() - started, overlapped=overlapped)
+        if report is not None:
+            app.logger.info(report)
+
+
+def main(argv: list[str] | None = None) -> int:
+    default_db = os.environ.get("DUUDL_DB_PATH", "data/duudl.db")
+    default_dir = os.environ.get("DUUDL_BACKUP_DIR", os.path.join(os.path.dirname(default_db), "backups"))
+    default_frozen_dir = os.environ.get("DUUDL_FROZEN_DIR", os.path.join(os.path.dirname(default_db), "frozen"))
+
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.backup",
+        description="Online backups of the Duudl database.",
+    )
+    parser.add_argument("--db", default=default_db, help="database path (default: %(default)s)")
+    parser.add_argument("--dir", default=default_dir, help="snapshot directory (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command")
+
+    backup_parser = sub.add_parser("backup", help="write a new snapshot (default)")
+    backup_parser.add_argument("--keep", type=int, default=int(os.environ.get("DUUDL_BACKUP_KEEP", "14")))
+    backup_parser.add_argument("--pages", type=int, default=64, help="pages copied per step")
+    backup_parser.add_argument("--sleep", type=float, default=0.01, help="seconds to sleep between steps")
+
+    sub.add_parser("list", help="list snapshots, newest first")
+
+    restore_parser = sub.add_parser("restore", help="restore a snapshot into the database")
+    restore_parser.add_argument("snapshot", nargs="?", help="snapshot path (default: newest)")
+    restore_parser.add_argument(
+        "--frozen-dir",
+        default=default_frozen_dir,
+        help="frozen Duudl snapshots to remove after restoring (default: %(default)s)",
+    )
+
+    args = parser.parse_args(argv)
+    command = args.command or "backup"
+
+    if command == "list":
+        for path in list_snapshots(args.dir):
+            print(f"{path}\t{os.path.getsize(path)}")
+        return 0
+
+    if command == "restore":
+        snapshot = args.snapshot
+        if snapshot is None:
+            snapshots = list_snapshots(args.dir)
+            if not snapshots:
+                print(f"no snapshots in {args.dir}", file=sys.stderr)
+                return 1
+            snapshot = snapshots[0]
+        started = time.monotonic()
+        restore_backup(snapshot, args.db, frozen_dir=args.frozen_dir)
+        print(f"restored {snapshot} -> {args.db} in {time.monotonic() - started:.2f}s")
+        return 0
+
+    if not os.path.exists(args.db):
+        print(f"database not found: {args.db}", file=sys.stderr)
+        return 1
+
+    with backup_lock(args.dir):
+        result = create_backup(
+            args.db,
+            args.dir,
+            pages_per_step=getattr(args, "pages", 64),
+            sleep_seconds=getattr(args, "sleep", 0.01),
+        )
+        rotate_snapshots(args.dir, keep=getattr(args, "keep", 14))
+    print(
+        f"wrote {result.path} ({result.pages} pages, {result.restarts} restarts, {result.size_bytes} bytes) "
+        f"in {result.duration_seconds:.2f}s; the app workers log the request latency it added"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
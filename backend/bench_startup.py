@@ -0,0 +1,165 @@
+"""
+Startup-time benchmark: starts gunicorn and measures the time until the first
+successful /healthz and /d/<token> responses.
+
+    python -m backend.bench_startup                        # compare default vs. tuned profile
+    python -m backend.bench_startup --rounds 5
+    python -m backend.bench_startup --baseline-ref <commit>  # run "default" on older code
+
+"default" is the old `gunicorn --workers 2` invocation; "tuned" uses backend.gunicorn_conf.
+Both run the current code unless --baseline-ref is given, so by default "default" already
+benefits from the Jinja bytecode cache and the once-per-process schema check. Pass the
+commit before backend/gunicorn_conf.py was added to compare against the old code as well.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.cookiejar
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+PROFILES = {
+    "default": ["--workers", "2"],
+    "tuned": ["-c", "python:backend.gunicorn_conf"],
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect (e.g. to /login) must not be mistaken for a successful page load.
+    def redirect_request(self, *args, **kwargs):  # type: ignore[no-untyped-def]
+        return None
+
+
+def _export_ref(ref: str) -> str:
+    """Exports backend/ at `ref` into a temp dir, to run the baseline against older code."""
+    target = tempfile.mkdtemp(prefix="duudl-bench-ref-")
+    archive = subprocess.run(["git", "archive", ref, "backend"], check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", target], input=archive, check=True)
+    return target
+
+
+def _seed_database(db_path: str) -> str:
+    from backend.app import create_app
+    from backend.db import create_duudl, ensure_schema
+
+    os.environ["DUUDL_DB_PATH"] = db_path
+    app = create_app()
+    with app.app_context():
+        ensure_schema()
+        create_duudl(
+            token="bench",
+            title="Benchmark",
+            description="",
+            created_by_user_id=1,
+            days=["2030-01-01", "2030-01-02", "2030-01-03"],
+        )
+    return "bench"
+
+
+def _wait_for(opener: urllib.request.OpenerDirector, url: str, deadline: float) -> None:
+    while time.monotonic() < deadline:
+        try:
+            with opener.open(url, timeout=2) as resp:
+                if resp.status == 200:
+                    return
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"{url} answered {e.code}") from None
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"no 200 from {url}")
+
+
+def _post(opener: urllib.request.OpenerDirector, url: str, form: dict[str, str]) -> None:
+    try:
+        opener.open(url, data=urllib.parse.urlencode(form).encode())
+    except urllib.error.HTTPError as e:
+        # Both form posts answer with a redirect on success.
+        if e.code not in (302, 303):
+            raise
+
+
+def run_once(profile: str, data_dir: str, token: str, *, code_dir: str) -> tuple[float, float]:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DUUDL_DB_PATH=os.path.join(data_dir, "duudl.db"))
+    cmd = [sys.executable, "-m", "gunicorn", *PROFILES[profile], "--bind", f"127.0.0.1:{port}", "backend.wsgi:app"]
+
+    started = time.monotonic()
+    proc = subprocess.Popen(cmd, cwd=code_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + 30
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect(),
+        )
+
+        _wait_for(opener, f"{base}/healthz", deadline)
+        healthz = time.monotonic() - started
+
+        _post(opener, f"{base}/login", {"password": "wattifnatt"})
+        _post(opener, f"{base}/select-user", {"user_id": "1"})
+        _wait_for(opener, f"{base}/d/{token}", deadline)
+        show = time.monotonic() - started
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+    return healthz, show
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.bench_startup",
+        description=__doc__.split("\n\n")[0],
+    )
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument(
+        "--profile",
+        choices=sorted(PROFILES),
+        action="append",
+        help="profile(s) to run (default: all)",
+    )
+    parser.add_argument(
+        "--baseline-ref",
+        help='git ref whose backend/ the "default" profile runs (default: current tree)',
+    )
+    args = parser.parse_args(argv)
+
+    current_dir = os.getcwd()
+    baseline_dir = _export_ref(args.baseline_ref) if args.baseline_ref else current_dir
+
+    for profile in args.profile or list(PROFILES):
+        # Fresh data dir per profile; the Jinja bytecode cache persists across rounds,
+        # as it does across restarts.
+        data_dir = tempfile.mkdtemp(prefix=f"duudl-bench-{profile}-")
+        token = _seed_database(os.path.join(data_dir, "duudl.db"))
+
+        code_dir = baseline_dir if profile == "default" else current_dir
+        results = [run_once(profile, data_dir, token, code_dir=code_dir) for _ in range(args.rounds)]
+        healthz = statistics.median(r[0] for r in results) * 1000
+        show = statistics.median(r[1] for r in results) * 1000
+        print(
+            f"{profile:8s} first /healthz: {healthz:7.1f} ms   "
+            f"first /d/<token>: {show:7.1f} ms   (median of {args.rounds})"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,7 +4,7 @@ import os
 import sqlite3
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Iterator
 
 from flask import current_app, g
 
@@ -33,6 +33,26 @@ class Duudl:
     description: str
     created_at: str
     created_by_user_id: int
+    revision: int
+    updated_at: str
+
+
+@dataclass(frozen=True)
+class CalendarEntry:
+    token: str
+    title: str
+    day: str
+    comment: str
+
+
+@dataclass(frozen=True)
+class AvailabilityRow:
+    day: str
+    value: str | None
+    comment: str
+    token: str
+    title: str
+    conflict: bool
 
 
 def utc_now_iso() -> str:
@@ -68,7 +88,9 @@ def ensure_schema() -> None:
         CREATE TABLE IF NOT EXISTS users (
           id INTEGER PRIMARY KEY,
           slug TEXT NOT NULL UNIQUE,
-          display_name TEXT NOT NULL UNIQUE
+          display_name TEXT NOT NULL UNIQUE,
+          calendar_revision INTEGER NOT NULL DEFAULT 0,
+          calendar_updated_at TEXT NOT NULL DEFAULT ''
         );
 
         CREATE TABLE IF NOT EXISTS duudls (
@@ -78,6 +100,8 @@ def ensure_schema() -> None:
           description TEXT NOT NULL DEFAULT '',
           created_by_user_id INTEGER NOT NULL,
           created_at TEXT NOT NULL,
+          revision INTEGER NOT NULL DEFAULT 0,
+          updated_at TEXT NOT NULL DEFAULT '',
           FOREIGN KEY(created_by_user_id) REFERENCES users(id)
         );
 
@@ -102,13 +126,18 @@ def ensure_schema() -> None:
         );
 
         CREATE INDEX IF NOT EXISTS idx_responses_duudl_id ON responses(duudl_id);
-        CREATE INDEX IF NOT EXISTS idx_responses_duudl_user_id ON responses(user_id);
+        DROP INDEX IF EXISTS idx_responses_duudl_user_id;
+        DROP INDEX IF EXISTS idx_responses_user_day;
+        CREATE INDEX IF NOT EXISTS idx_responses_user_availability
+          ON responses(user_id, day, duudl_id, value, comment);
         CREATE INDEX IF NOT EXISTS idx_duudl_dates_duudl_id ON duudl_dates(duudl_id);
         """
     )
 
     _ensure_duudls_has_description(db)
     _ensure_responses_has_comment(db)
+    _ensure_duudls_has_revision(db)
+    _ensure_users_has_calendar_revision(db)
     seed_users(db)
     db.commit()
 
@@ -127,6 +156,72 @@ def _ensure_responses_has_comment(db: sqlite3.Connection) -> None:
     db.execute("ALTER TABLE responses ADD COLUMN comment TEXT NOT NULL DEFAULT ''")
 
 
+def _ensure_duudls_has_revision(db: sqlite3.Connection) -> None:
+    cols = [r["name"] for r in db.execute("PRAGMA table_info(duudls)").fetchall()]
+    if "revision" not in cols:
+        db.execute("ALTER TABLE duudls ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+    if "updated_at" not in cols:
+        db.execute("ALTER TABLE duudls ADD COLUMN updated_at TEXT NOT NULL DEFAULT ''")
+        db.execute("UPDATE duudls SET updated_at = created_at")
+
+
+def _ensure_users_has_calendar_revision(db: sqlite3.Connection) -> None:
+    cols = [r["name"] for r in db.execute("PRAGMA table_info(users)").fetchall()]
+    if "calendar_revision" not in cols:
+        db.execute("ALTER TABLE users ADD COLUMN calendar_revision INTEGER NOT NULL DEFAULT 0")
+    if "calendar_updated_at" not in cols:
+        db.execute("ALTER TABLE users ADD COLUMN calendar_updated_at TEXT NOT NULL DEFAULT ''")
+
+
+def _bump_timestamp_sql(column: str) -> str:
+    """
+    SQL that sets `column` to now (the first `?`) or, if that would not move it forward,
+    to one second after its current value (the second `?` is now as well). Validators then
+    always change, even for edits within the same second as the previous fetch.
+    """
+    return f"""CASE
+            WHEN {column} >= ? THEN strftime('%Y-%m-%dT%H:%M:%SZ', {column}, '+1 second')
+            ELSE ?
+          END"""
+
+
+def _touch_calendars(db: sqlite3.Connection, where: str, params: tuple[Any, ...]) -> None:
+    """Bumps the calendar revision and timestamp of the users matched by `where`."""
+    now = utc_now_iso()
+    db.execute(
+        f"""
+        UPDATE users SET
+          calendar_revision = calendar_revision + 1,
+          calendar_updated_at = {_bump_timestamp_sql("calendar_updated_at")}
+        WHERE {where}
+        """,
+        (now, now, *params),
+    )
+
+
+def _touch_yes_calendars(db: sqlite3.Connection, duudl_id: int) -> None:
+    # Everyone with a "yes" in this Duudl has it in their calendar feed.
+    _touch_calendars(
+        db,
+        "id IN (SELECT DISTINCT user_id FROM responses WHERE duudl_id = ? AND value = 'yes')",
+        (duudl_id,),
+    )
+
+
+def _touch_duudl(db: sqlite3.Connection, duudl_id: int) -> None:
+    # Bumped on every change to a Duudl or its responses; drives ETag/Last-Modified on exports.
+    now = utc_now_iso()
+    db.execute(
+        f"""
+        UPDATE duudls SET
+          revision = revision + 1,
+          updated_at = {_bump_timestamp_sql("updated_at")}
+        WHERE id = ?
+        """,
+        (now, now, duudl_id),
+    )
+
+
 def seed_users(db: sqlite3.Connection) -> None:
     users = [
         ("huez-helge", "Huez-Helge"),
@@ -189,8 +284,11 @@ def create_duudl(*, token: str, title: str, description: str, created_by_user_id
     db = get_db()
     created_at = utc_now_iso()
     cur = db.execute(
-        "INSERT INTO duudls (token, title, description, created_by_user_id, created_at) VALUES (?, ?, ?, ?, ?)",
-        (token, title, description, created_by_user_id, created_at),
+        """
+        INSERT INTO duudls (token, title, description, created_by_user_id, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (token, title, description, created_by_user_id, created_at, created_at),
     )
     duudl_id = int(cur.lastrowid)
 
@@ -205,12 +303,16 @@ def create_duudl(*, token: str, title: str, description: str, created_by_user_id
             (duudl_id, created_by_user_id, day),
         )
 
+    _touch_calendars(db, "id = ?", (created_by_user_id,))
     db.commit()
 
 
 def get_duudl_by_token(token: str) -> Duudl | None:
     row = get_db().execute(
-        "SELECT id, token, title, description, created_at, created_by_user_id FROM duudls WHERE token = ?",
+        """
+        SELECT id, token, title, description, created_at, created_by_user_id, revision, updated_at
+        FROM duudls WHERE token = ?
+        """,
         (token,),
     ).fetchone()
     if row is None:
@@ -222,6 +324,8 @@ def get_duudl_by_token(token: str) -> Duudl | None:
         description=row["description"],
         created_at=row["created_at"],
         created_by_user_id=row["created_by_user_id"],
+        revision=row["revision"],
+        updated_at=row["updated_at"] or row["created_at"],
     )
 
 
@@ -272,6 +376,8 @@ def upsert_response(*, duudl_id: int, user_id: int, day: str, value: str | None,
             """,
             (duudl_id, user_id, day, value, comment_to_store),
         )
+    _touch_duudl(db, duudl_id)
+    _touch_calendars(db, "id = ?", (user_id,))
     db.commit()
 
 
@@ -303,16 +409,21 @@ def update_duudl(*, duudl_id: int, title: str, description: str, new_days: list[
                     (duudl_id, creator_user_id, day),
                 )
 
+    # Before removing dates, so users whose only "yes" days are removed are included.
+    _touch_yes_calendars(db, duudl_id)
+
     for day in removed:
         db.execute("DELETE FROM duudl_dates WHERE duudl_id = ? AND day = ?", (duudl_id, day))
         db.execute("DELETE FROM responses WHERE duudl_id = ? AND day = ?", (duudl_id, day))
 
+    _touch_duudl(db, duudl_id)
     db.commit()
     return removed
 
 
 def delete_duudl(*, duudl_id: int) -> None:
     db = get_db()
+    _touch_yes_calendars(db, duudl_id)
     db.execute("DELETE FROM duudls WHERE id = ?", (duudl_id,))
     db.commit()
 
@@ -328,3 +439,134 @@ def fetch_duudl_state_json(duudl_id: int) -> dict[str, Any]:
         "comments": {f"{user_id}:{day}": comment for (user_id, day), comment in comments.items() if comment},
     }
 
+
+def iter_duudl_grid_rows(duudl_id: int) -> Iterator[tuple[str, dict[int, tuple[str | None, str]]]]:
+    """
+    Yields (day, {user_id: (value, comment)}) one date at a time, in date order.
+    The dates and the responses are read as two day-ordered streams and merged,
+    so the Duudl's responses are scanned once rather than once per date.
+    """
+    db = get_db()
+    days = db.execute("SELECT day FROM duudl_dates WHERE duudl_id = ? ORDER BY day", (duudl_id,))
+    responses = db.execute(
+        "SELECT day, user_id, value, comment FROM responses WHERE duudl_id = ? ORDER BY day",
+        (duudl_id,),
+    )
+    pending = responses.fetchone()
+    for d in days:
+        day = str(d["day"])
+        # Skip responses for days that are no longer part of the Duudl.
+        while pending is not None and str(pending["day"]) < day:
+            pending = responses.fetchone()
+        cells: dict[int, tuple[str | None, str]] = {}
+        while pending is not None and str(pending["day"]) == day:
+            cells[int(pending["user_id"])] = (pending["value"], str(pending["comment"] or ""))
+            pending = responses.fetchone()
+        yield day, cells
+
+
+def get_user_calendar_version(user_id: int) -> tuple[int, str] | None:
+    """
+    Returns (revision, last_modified_iso) for a user's "yes" calendar, or None for an unknown user.
+    Both only move forward: they are bumped by every change that can alter the user's feed.
+    """
+    row = get_db().execute(
+        "SELECT calendar_revision, calendar_updated_at FROM users WHERE id = ?",
+        (user_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    return int(row["calendar_revision"]), str(row["calendar_updated_at"])
+
+
+def iter_user_calendar_entries(user_id: int) -> Iterator[CalendarEntry]:
+    cur = get_db().execute(
+        """
+        SELECT d.token, d.title, r.day, r.comment
+        FROM responses r
+        JOIN duudls d ON d.id = r.duudl_id
+        WHERE r.user_id = ? AND r.value = 'yes'
+        ORDER BY r.day, d.id
+        """,
+        (user_id,),
+    )
+    for r in cur:
+        yield CalendarEntry(token=r["token"], title=r["title"], day=r["day"], comment=str(r["comment"] or ""))
+
+
+def list_user_availability(user_id: int, *, day_from: str, day_to: str) -> list[AvailabilityRow]:
+    """
+    Returns one user's answers across all Duudls between two days (inclusive), in date order.
+    A row is a conflict when the user said "yes" to more than one Duudl on that day.
+    Served entirely by idx_responses_user_availability (in index order, no sort step), plus one
+    primary-key lookup per row for the Duudl, so cost grows with the result, not with the number of Duudls.
+    """
+    cur = get_db().execute(
+        """
+        SELECT r.day, r.value, r.comment, d.token, d.title
+        FROM responses r
+        JOIN duudls d ON d.id = r.duudl_id
+        WHERE r.user_id = ? AND r.day BETWEEN ? AND ?
+          AND (r.value IS NOT NULL OR r.comment != '')
+        ORDER BY r.day, r.duudl_id
+        """,
+        (user_id, day_from, day_to),
+    )
+
+    result: list[AvailabilityRow] = []
+    day_rows: list[Any] = []
+
+    def flush() -> None:
+        conflict = sum(1 for r in day_rows if r["value"] == "yes") > 1
+        for r in day_rows:
+            result.append(
+                AvailabilityRow(
+                    day=r["day"],
+                    value=r["value"],
+                    comment=str(r["comment"] or ""),
+                    token=r["token"],
+                    title=r["title"],
+                    conflict=conflict and r["value"] == "yes",
+                )
+            )
+        day_rows.clear()
+
+    for r in cur:
+        if day_rows and day_rows[0]["day"] != r["day"]:
+            flush()
+        day_rows.append(r)
+    flush()
+    return result
+
+
+def get_duudl_freeze_state(token: str) -> tuple[int, str | None] | None:
+    """Returns (revision, last day) for a Duudl, or None if it does not exist."""
+    row = get_db().execute(
+        """
+        SELECT d.revision, MAX(dd.day) AS last_day
+        FROM duudls d
+        LEFT JOIN duudl_dates dd ON dd.duudl_id = d.id
+        WHERE d.token = ?
+        GROUP BY d.id
+        """,
+        (token,),
+    ).fetchone()
+    if row is None:
+        return None
+    return int(row["revision"]), row["last_day"]
+
+
+def list_finished_duudl_tokens(*, before_day: str) -> list[str]:
+    """Tokens of Duudls whose dates are all before `before_day` (YYYY-MM-DD)."""
+    rows = get_db().execute(
+        """
+        SELECT d.token
+        FROM duudls d
+        JOIN duudl_dates dd ON dd.duudl_id = d.id
+        GROUP BY d.id
+        HAVING MAX(dd.day) < ?
+        ORDER BY d.id
+        """,
+        (before_day,),
+    ).fetchall()
+    return [r["token"] for r in rows]
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import csv
+import io
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator
+
+from flask import Response, current_app, request, stream_with_context, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from backend.db import Duudl, User, iter_duudl_grid_rows, iter_user_calendar_entries
+
+VALUE_LABELS = {"yes": "Ja", "no": "Nei", "inconvenient": "Muligens"}
+
+
+def _parse_iso(value: str) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def conditional_stream(
+    chunks: Iterator[str],
+    *,
+    etag: str,
+    last_modified: str,
+    mimetype: str,
+    filename: str | None = None,
+) -> Response:
+    """
+    Streams `chunks` to the client, or answers 304 without touching the generator
+    when the client's If-None-Match / If-Modified-Since is still current.
+    """
+    modified = _parse_iso(last_modified)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    elif request.if_modified_since is not None and modified is not None:
+        not_modified = modified <= request.if_modified_since
+    else:
+        not_modified = False
+
+    if not_modified:
+        response = Response(status=304)
+    else:
+        response = Response(stream_with_context(chunks), mimetype=mimetype)
+        if filename:
+            response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def iter_duudl_csv(duudl: Duudl, users: list[User]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def flush() -> str:
+        chunk = buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        return chunk
+
+    # BOM so spreadsheet apps pick up UTF-8 (æøå) correctly.
+    buf.write("\ufeff")
+    writer.writerow(["Dato", *[u.display_name for u in users]])
+    yield flush()
+
+    for day, cells in iter_duudl_grid_rows(duudl.id):
+        row = [day]
+        for u in users:
+            value, comment = cells.get(u.id, (None, ""))
+            text = VALUE_LABELS.get(value or "", "")
+            if comment:
+                text = f"{text} ({comment})" if text else comment
+            row.append(text)
+        writer.writerow(row)
+        yield flush()
+
+
+def calendar_feed_token(user_id: int) -> str:
+    return URLSafeSerializer(current_app.secret_key, salt="duudl-ics").dumps(user_id)
+
+
+def user_id_from_feed_token(feed_token: str) -> int | None:
+    try:
+        return int(URLSafeSerializer(current_app.secret_key, salt="duudl-ics").loads(feed_token))
+    except (BadSignature, TypeError, ValueError):
+        return None
+
+
+def _ics_escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _ics_line(line: str) -> str:
+    """Folds a content line at 75 octets, as required by RFC 5545."""
+    out: list[str] = []
+    current = ""
+    current_len = 0
+    for ch in line:
+        ch_len = len(ch.encode("utf-8"))
+        if current_len + ch_len > 75:
+            out.append(current)
+            current = " "
+            current_len = 1
+        current += ch
+        current_len += ch_len
+    out.append(current)
+    return "\r\n".join(out) + "\r\n"
+
+
+def iter_user_ics(user: User, *, last_modified: str) -> Iterator[str]:
+    stamp = (_parse_iso(last_modified) or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+    yield "".join(
+        _ics_line(line)
+        for line in (
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//Duudl//Duudl//NO",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{_ics_escape(f'Duudl – {user.display_name}')}",
+        )
+    )
+
+    for entry in iter_user_calendar_entries(user.id):
+        try:
+            start = date.fromisoformat(entry.day)
+        except ValueError:
+            continue
+        end = start + timedelta(days=1)
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{entry.token}-{entry.day}-{user.id}@duudl",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}",
+            f"DTEND;VALUE=DATE:{end.strftime('%Y%m%d')}",
+            f"SUMMARY:{_ics_escape(entry.title)}",
+            f"URL:{url_for('show_duudl', token=entry.token, _external=True)}",
+            "TRANSP:TRANSPARENT",
+        ]
+        if entry.comment:
+            lines.append(f"DESCRIPTION:{_ics_escape(entry.comment)}")
+        lines.append("END:VEVENT")
+        yield "".join(_ics_line(line) for line in lines)
+
+    yield _ics_line("END:VCALENDAR")
@@ -0,0 +1,320 @@
+"""
+Static snapshots of finished Duudls (all dates in the past), served by nginx.
+
+For each frozen Duudl, data/frozen/<token>/ holds:
+    page-<user_id>.html(.gz)   the show page as rendered for that user
+    state.json(.gz)            the /api/duudl/<token> payload
+
+nginx asks /_auth/frozen who the visitor is and serves the matching file directly;
+anything missing falls through to the app. Any edit to the Duudl removes its snapshot,
+and a restore or deploy removes all of them.
+
+    python -m backend.freeze                 # freeze all finished Duudls
+    python -m backend.freeze <token> ...     # (re)freeze specific Duudls
+    python -m backend.freeze --unfreeze <token> ...
+    python -m backend.freeze --unfreeze      # remove every snapshot
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import secrets
+import shutil
+import sys
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Callable, Iterable, Iterator
+
+from flask import Flask, Response, g, request, session
+
+from backend.db import ensure_schema, get_duudl_freeze_state, list_finished_duudl_tokens, list_users
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on the Linux server
+    fcntl = None  # type: ignore[assignment]
+
+AUTH_PATH = "/_auth/frozen"
+FREEZING_ENVIRON_KEY = "duudl.freezing"
+FROZEN_ENDPOINTS = ("show_duudl", "api_duudl")
+STATE_FILENAME = "state.json"
+REVISION_FILENAME = ".revision"
+
+
+def snapshot_dir(app: Flask, token: str) -> str:
+    return os.path.join(app.config["FROZEN_DIR"], token)
+
+
+def page_filename(user_id: int) -> str:
+    return f"page-{user_id}.html"
+
+
+def is_finished(last_day: str | None, *, today: str | None = None) -> bool:
+    today = today or date.today().isoformat()
+    return last_day is not None and last_day < today
+
+
+def _match_owner(frozen_dir: str, path: str) -> None:
+    # When the CLI runs as root, hand files to the service user so the app can still invalidate them.
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        st = os.stat(frozen_dir)
+        os.chown(path, st.st_uid, st.st_gid)
+
+
+@contextmanager
+def _snapshot_lock(frozen_dir: str) -> Iterator[None]:
+    """
+    Serializes snapshot writes and invalidation across processes. Writers re-check the
+    Duudl's revision while holding it, and edits commit before invalidating, so a snapshot
+    rendered before an edit can never land after that edit's invalidation.
+    """
+    os.makedirs(frozen_dir, exist_ok=True)
+    lock_path = os.path.join(frozen_dir, ".lock")
+    with open(lock_path, "a") as lock_file:
+        _match_owner(frozen_dir, lock_path)
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _read_revision(directory: str) -> int | None:
+    try:
+        with open(os.path.join(directory, REVISION_FILENAME), "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_file(app: Flask, path: str, body: bytes) -> None:
+    with open(path + ".partial", "wb") as f:
+        f.write(body)
+    _match_owner(app.config["FROZEN_DIR"], path + ".partial")
+    os.replace(path + ".partial", path)
+
+
+def _remove_snapshot_dir(app: Flask, token: str) -> None:
+    """
+    Moves the snapshot out of nginx's reach first (a rename only needs write access to the
+    frozen dir itself), then deletes it. Failures are logged rather than hidden, since a
+    snapshot that stays in place keeps being served.
+    """
+    directory = snapshot_dir(app, token)
+    stale = os.path.join(app.config["FROZEN_DIR"], f".stale-{token}-{secrets.token_hex(4)}")
+    try:
+        os.rename(directory, stale)
+    except FileNotFoundError:
+        return
+    except OSError:
+        app.logger.exception(
+            "could not remove snapshot %s; nginx keeps serving it until it is removed", directory
+        )
+        return
+    try:
+        shutil.rmtree(stale)
+    except OSError:
+        app.logger.exception("could not delete stale snapshot %s", stale)
+
+
+def write_snapshot_files(app: Flask, token: str, revision: int, files: dict[str, bytes]) -> bool:
+    """
+    Writes snapshot files rendered at `revision`, each as plain and precompressed `.gz`
+    (for nginx gzip_static). Returns False without writing if the Duudl has changed since.
+    Must be called inside an app context.
+    """
+    with _snapshot_lock(app.config["FROZEN_DIR"]):
+        current = get_duudl_freeze_state(token)
+        if current is None or current[0] != revision:
+            return False
+
+        directory = snapshot_dir(app, token)
+        if os.path.isdir(directory) and _read_revision(directory) != revision:
+            _remove_snapshot_dir(app, token)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+            _match_owner(app.config["FROZEN_DIR"], directory)
+            os.chmod(directory, 0o755)
+            _write_file(app, os.path.join(directory, REVISION_FILENAME), str(revision).encode())
+
+        for filename, body in files.items():
+            path = os.path.join(directory, filename)
+            # Compressed copy first: nginx keys off the plain file, and gzip_static then picks up the .gz.
+            _write_file(app, path + ".gz", gzip.compress(body, compresslevel=9))
+            _write_file(app, path, body)
+    return True
+
+
+def invalidate_snapshot(app: Flask, token: str) -> None:
+    """Removes a Duudl's snapshot. Call after the edit is committed."""
+    with _snapshot_lock(app.config["FROZEN_DIR"]):
+        _remove_snapshot_dir(app, token)
+
+
+def remove_all_snapshots(frozen_dir: str) -> list[str]:
+    """
+    Removes every snapshot, for when the database or the code behind the pages changed
+    wholesale (a restore or a deploy). Returns the removed tokens; errors are raised.
+    """
+    if not os.path.isdir(frozen_dir):
+        return []
+    removed: list[str] = []
+    with _snapshot_lock(frozen_dir):
+        for name in sorted(os.listdir(frozen_dir)):
+            path = os.path.join(frozen_dir, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            os.rename(path, os.path.join(frozen_dir, f".stale-{name}-{secrets.token_hex(4)}"))
+            removed.append(name)
+        # Also clears out anything an earlier failed removal left behind.
+        for name in os.listdir(frozen_dir):
+            if name.startswith(".stale-"):
+                shutil.rmtree(os.path.join(frozen_dir, name))
+    return removed
+
+
+class FrozenAuthMiddleware:
+    """
+    Answers nginx's auth_request subrequest for snapshots (AUTH_PATH) before Flask
+    dispatches the request, so it skips every before_request hook, the database and the
+    templates. It only decodes the session cookie and tells nginx whose page to serve.
+    """
+
+    def __init__(self, app: Flask, wsgi_app: Callable[..., Iterable[bytes]]) -> None:
+        self.app = app
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable[..., Any]) -> Iterable[bytes]:
+        if environ.get("PATH_INFO") != AUTH_PATH:
+            return self.wsgi_app(environ, start_response)
+
+        sess = self.app.session_interface.open_session(self.app, self.app.request_class(environ))
+        user_id = sess.get("user_id") if sess is not None else None
+        if sess is None or not sess.get("authed") or user_id is None:
+            response = Response(status=401)
+        else:
+            response = Response(status=204)
+            response.headers["X-Duudl-User"] = str(int(user_id))
+        return response(environ, start_response)
+
+
+def freeze_duudl(app: Flask, token: str) -> bool:
+    """
+    Renders the final page (once per user) and JSON payload through the app itself.
+    Returns False if the Duudl changed while it was being rendered.
+    """
+    with app.app_context():
+        users = list_users()
+        state = get_duudl_freeze_state(token)
+    if state is None:
+        raise RuntimeError(f"unknown Duudl: {token}")
+    revision = state[0]
+
+    client = app.test_client()
+    client.environ_base[FREEZING_ENVIRON_KEY] = True
+    files: dict[str, bytes] = {}
+    for user in users:
+        with client.session_transaction() as sess:
+            sess["authed"] = True
+            sess["user_id"] = user.id
+
+        page = client.get(f"/d/{token}")
+        if page.status_code != 200:
+            raise RuntimeError(f"/d/{token} returned {page.status_code}")
+        files[page_filename(user.id)] = page.get_data()
+
+    payload = client.get(f"/api/duudl/{token}")
+    if payload.status_code != 200:
+        raise RuntimeError(f"/api/duudl/{token} returned {payload.status_code}")
+    files[STATE_FILENAME] = payload.get_data()
+
+    with app.app_context():
+        return write_snapshot_files(app, token, revision, files)
+
+
+def init_app(app: Flask) -> None:
+    """
+    Sets up the snapshot directory and nginx's auth endpoint and, with DUUDL_FREEZE_AUTO=1,
+    freezes a finished Duudl's page/payload as a side effect of serving it, so nginx takes
+    over from then on.
+    """
+    app.config["FROZEN_DIR"] = os.environ.get(
+        "DUUDL_FROZEN_DIR", os.path.join(os.path.dirname(app.config["DATABASE_PATH"]), "frozen")
+    )
+    app.wsgi_app = FrozenAuthMiddleware(app, app.wsgi_app)  # type: ignore[method-assign]
+    app.config["FREEZE_AUTO"] = os.environ.get("DUUDL_FREEZE_AUTO", "") == "1"
+    if not app.config["FREEZE_AUTO"]:
+        return
+
+    @app.before_request
+    def _note_freeze_candidate():
+        if request.endpoint not in FROZEN_ENDPOINTS or request.environ.get(FREEZING_ENVIRON_KEY):
+            return
+        # A pending flash message would be baked into the page; freeze on a later view instead.
+        if request.endpoint == "show_duudl" and "flash_error" in session:
+            return
+        state = get_duudl_freeze_state((request.view_args or {}).get("token", ""))
+        # Live Duudls stop here: one lookup, nothing in after_request.
+        if state is not None and is_finished(state[1]):
+            g.freeze_revision = state[0]
+
+    @app.after_request
+    def _auto_freeze(response):
+        revision = g.pop("freeze_revision", None)
+        if revision is None or response.status_code != 200:
+            return response
+
+        token = (request.view_args or {})["token"]
+        user_id = session.get("user_id")
+        filename = page_filename(int(user_id)) if request.endpoint == "show_duudl" else STATE_FILENAME
+        try:
+            write_snapshot_files(app, token, revision, {filename: response.get_data()})
+        except OSError:
+            app.logger.exception("could not freeze %s", token)
+        return response
+
+
+def main(argv: list[str] | None = None) -> int:
+    from backend.app import create_app
+
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.freeze",
+        description="Freeze finished Duudls into static snapshots.",
+    )
+    parser.add_argument("tokens", nargs="*", help="Duudl tokens (default: all finished Duudls)")
+    parser.add_argument(
+        "--unfreeze",
+        action="store_true",
+        help="remove the snapshots for the given tokens (default: all snapshots)",
+    )
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    if args.unfreeze and not args.tokens:
+        for token in remove_all_snapshots(app.config["FROZEN_DIR"]):
+            print(f"unfrozen {token}")
+        return 0
+    if args.unfreeze:
+        for token in args.tokens:
+            invalidate_snapshot(app, token)
+            print(f"unfrozen {token}")
+        return 0
+
+    with app.app_context():
+        ensure_schema()
+        tokens = args.tokens or list_finished_duudl_tokens(before_day=date.today().isoformat())
+        for token in args.tokens:
+            if get_duudl_freeze_state(token) is None:
+                print(f"unknown Duudl: {token}", file=sys.stderr)
+                return 1
+
+    for token in tokens:
+        if freeze_duudl(app, token):
+            print(f"frozen {token} -> {snapshot_dir(app, token)}")
+        else:
+            print(f"skipped {token}: it changed while being frozen", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
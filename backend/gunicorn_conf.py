@@ -0,0 +1,43 @@
+"""
+Production gunicorn settings for Duudl.
+
+    gunicorn -c python:backend.gunicorn_conf backend.wsgi:app
+
+The app is imported once in the master (preload_app); the schema check and
+template compilation run there before any worker is forked. Per-worker state
+(the optional backup scheduler thread) is started again in each worker after fork.
+
+Environment:
+    DUUDL_BIND           bind address (default 127.0.0.1:5011)
+    DUUDL_WORKERS        number of worker processes (default 2)
+    DUUDL_THREADS        threads per worker (default 1)
+    DUUDL_WORKER_CLASS   gunicorn worker class (default gthread if DUUDL_THREADS > 1, else sync)
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any
+
+bind = os.environ.get("DUUDL_BIND", "127.0.0.1:5011")
+workers = int(os.environ.get("DUUDL_WORKERS", "2"))
+threads = int(os.environ.get("DUUDL_THREADS", "1"))
+worker_class = os.environ.get("DUUDL_WORKER_CLASS", "gthread" if threads > 1 else "sync")
+
+preload_app = True
+
+
+def when_ready(server: Any) -> None:
+    from backend.app import warm_up
+
+    warm_up(server.app.wsgi())
+    server.log.info("duudl: schema checked and templates compiled in master")
+
+
+def post_fork(server: Any, worker: Any) -> None:
+    from backend.backup import start_scheduler
+
+    # SQLite connections are opened per request (backend.db.get_db), and the master
+    # closed its warm-up connection, so no database handle crosses the fork.
+    # Threads do not survive fork, so per-worker background work starts here.
+    start_scheduler(server.app.wsgi())
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import FrameType
+
+from flask import Flask, g, request
+
+from backend.auth import is_authed
+
+PROFILE_HEADER = "X-Duudl-Profile"
+
+_DB_FILE = os.path.join("backend", "db.py")
+_TEMPLATES_DIR = os.path.join("backend", "templates")
+_JINJA_PACKAGE = os.sep + "jinja2" + os.sep
+
+
+def _frame_category(filename: str) -> str | None:
+    if filename.endswith(_DB_FILE):
+        return "db"
+    if _JINJA_PACKAGE in filename or _TEMPLATES_DIR in filename:
+        return "jinja"
+    return None
+
+
+def collapse_stack(frame: FrameType | None) -> str:
+    """
+    Returns a collapsed-stack line (root first, ';'-separated) prefixed by a category:
+    'db' or 'jinja' when the innermost matching frame is in backend/db.py or Jinja
+    rendering, otherwise 'app'. This keeps the two separable in a flamegraph.
+    """
+    names: list[str] = []
+    category: str | None = None
+    while frame is not None:
+        code = frame.f_code
+        if category is None:
+            category = _frame_category(code.co_filename)
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.append(category or "app")
+    names.reverse()
+    return ";".join(names)
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval from a helper thread.
+    The profiled thread runs unmodified, so overhead is limited to the sampling itself.
+    """
+
+    def __init__(self, thread_id: int, interval_seconds: float) -> None:
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="duudl-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter[str]:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+
+def _prune_profiles(profile_dir: str, keep: int) -> None:
+    names = sorted(n for n in os.listdir(profile_dir) if n.endswith(".collapsed"))
+    for name in names[: max(len(names) - keep, 0)]:
+        # Another worker may be pruning the same directory.
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(profile_dir, name))
+
+
+def write_collapsed(profile_dir: str, label: str, stacks: Counter[str]) -> str:
+    os.makedirs(profile_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    path = os.path.join(profile_dir, f"{stamp}-{os.getpid()}-{label}.collapsed")
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+def init_app(app: Flask) -> None:
+    """
+    Registers the per-request profiler. When DUUDL_PROFILE is not set nothing is
+    registered, so a disabled profiler costs nothing per request.
+
+    A request is profiled when it is picked by DUUDL_PROFILE_SAMPLE_RATE, or when a
+    logged-in client sends the X-Duudl-Profile header.
+    """
+    app.config["PROFILE_ENABLED"] = os.environ.get("DUUDL_PROFILE", "") == "1"
+    if not app.config["PROFILE_ENABLED"]:
+        return
+
+    app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("DUUDL_PROFILE_SAMPLE_RATE", "0"))
+    app.config["PROFILE_INTERVAL_SECONDS"] = float(os.environ.get("DUUDL_PROFILE_INTERVAL_MS", "5")) / 1000.0
+    app.config["PROFILE_KEEP"] = int(os.environ.get("DUUDL_PROFILE_KEEP", "500"))
+    app.config["PROFILE_DIR"] = os.environ.get(
+        "DUUDL_PROFILE_DIR", os.path.join(os.path.dirname(app.config["DATABASE_PATH"]), "profiles")
+    )
+
+    def _should_profile() -> bool:
+        if request.headers.get(PROFILE_HEADER) and is_authed():
+            return True
+        rate = app.config["PROFILE_SAMPLE_RATE"]
+        return rate > 0 and random.random() < rate
+
+    @app.before_request
+    def _start_profiler():
+        if request.endpoint == "static" or not _should_profile():
+            return
+        sampler = StackSampler(threading.get_ident(), app.config["PROFILE_INTERVAL_SECONDS"])
+        g.profiler = sampler
+        g.profiler_started = time.perf_counter()
+        sampler.start()
+
+    @app.teardown_request
+    def _stop_profiler(_exc: BaseException | None = None) -> None:
+        sampler: StackSampler | None = g.pop("profiler", None)
+        if sampler is None:
+            return
+        stacks = sampler.stop()
+        elapsed_ms = (time.perf_counter() - g.pop("profiler_started")) * 1000.0
+        label = request.endpoint or "unknown"
+        try:
+            path = write_collapsed(app.config["PROFILE_DIR"], label, stacks)
+        except OSError:
+            app.logger.exception("could not write profile for %s", request.path)
+            return
+
+        by_category: Counter[str] = Counter()
+        for stack, count in stacks.items():
+            by_category[stack.split(";", 1)[0]] += count
+        app.logger.info(
+            "profiled %s %s in %.1f ms (samples: app=%d db=%d jinja=%d) -> %s",
+            request.method,
+            request.path,
+            elapsed_ms,
+            by_category["app"],
+            by_category["db"],
+            by_category["jinja"],
+            path,
+        )
+        try:
+            _prune_profiles(app.config["PROFILE_DIR"], app.config["PROFILE_KEEP"])
+        except OSError:
+            app.logger.exception("could not prune old profiles in %s", app.config["PROFILE_DIR"])
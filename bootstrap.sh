@@ -24,6 +24,7 @@ PYTHON_BIN="${DUUDL_PYTHON_BIN:-python3}"
 VENV_DIR="${DUUDL_VENV_DIR:-$APP_DIR/.venv}"
 SECRET_FILE="${DUUDL_SECRET_FILE:-$APP_DIR/.secret_key}"
 DB_PATH="${DUUDL_DB_PATH:-$APP_DIR/data/duudl.db}"
+FROZEN_DIR="${DUUDL_FROZEN_DIR:-$APP_DIR/data/frozen}"
 
 SYSTEMD_UNIT_PATH="/etc/systemd/system/${SERVICE_NAME}.service"
 NGINX_SITES_AVAILABLE_DIR="/etc/nginx/sites-available"
@@ -51,6 +52,7 @@ fi
 cd "$APP_DIR"
 
 mkdir -p "$APP_DIR/data"
+mkdir -p "$FROZEN_DIR"
 
 if [[ ! -d "$VENV_DIR" ]]; then
   echo "[duudl] creating venv: $VENV_DIR"
@@ -82,6 +84,10 @@ if ! id "$APP_USER" >/dev/null 2>&1; then
 fi
 
 chown -R "$APP_USER":"$APP_USER" "$APP_DIR/data"
+# nginx serves frozen snapshots directly: it may traverse data/ and read data/frozen/, nothing else.
+# The chown -R above also hands back any snapshot files written by a root-run freeze.
+chmod o+x "$APP_DIR/data"
+chmod 755 "$FROZEN_DIR"
 chown "$APP_USER":"$APP_USER" "$SECRET_FILE"
 
 echo "[duudl] writing systemd unit: $SYSTEMD_UNIT_PATH"
@@ -96,7 +102,11 @@ User=$APP_USER
 WorkingDirectory=$APP_DIR
 Environment=DUUDL_DB_PATH=$DB_PATH
 Environment=DUUDL_SECRET_KEY_FILE=$SECRET_FILE
-ExecStart=$VENV_DIR/bin/gunicorn --workers 2 --bind 127.0.0.1:$PORT backend.wsgi:app
+Environment=DUUDL_FROZEN_DIR=$FROZEN_DIR
+Environment=DUUDL_FREEZE_AUTO=${DUUDL_FREEZE_AUTO:-1}
+Environment=DUUDL_WORKERS=${DUUDL_WORKERS:-2}
+Environment=DUUDL_THREADS=${DUUDL_THREADS:-1}
+ExecStart=$VENV_DIR/bin/gunicorn -c python:backend.gunicorn_conf --bind 127.0.0.1:$PORT backend.wsgi:app
 Restart=always
 RestartSec=2
 
@@ -107,6 +117,76 @@ EOF
 systemctl daemon-reload
 systemctl enable "$SERVICE_NAME"
 systemctl restart "$SERVICE_NAME"
+# Snapshots were rendered by the previous code and templates. Clear them only once the old
+# workers are gone (under the app's snapshot lock), so none of them can re-freeze a stale page.
+flock "$FROZEN_DIR/.lock" find "$FROZEN_DIR" -mindepth 1 -maxdepth 1 ! -name .lock -exec rm -rf {} +
+
+write_nginx_app_locations() {
+  # Finished Duudls are frozen into $FROZEN_DIR by the app (see backend/freeze.py).
+  # nginx serves those files directly after asking the app who the user is (no DB work).
+  # Only frozen Duudls pay for that subrequest; anything not frozen, or any visitor without
+  # a session, falls through to gunicorn.
+  cat <<EOF
+  location = /_duudl_auth {
+    internal;
+    proxy_pass http://127.0.0.1:$PORT/_auth/frozen;
+    proxy_pass_request_body off;
+    proxy_set_header Content-Length "";
+    proxy_set_header Host \$host;
+  }
+
+  location ~ ^/d/(?<duudl_token>[A-Za-z0-9_-]+)\$ {
+    # Live Duudls (no snapshot dir) go straight to the app, without an auth subrequest.
+    error_page 418 = @duudl_app;
+    if (!-d $FROZEN_DIR/\$duudl_token) {
+      return 418;
+    }
+
+    auth_request /_duudl_auth;
+    auth_request_set \$duudl_user \$upstream_http_x_duudl_user;
+    error_page 401 = @duudl_app;
+
+    root $FROZEN_DIR;
+    default_type text/html;
+    charset utf-8;
+    gzip_static on;
+    add_header Cache-Control "private, no-cache";
+    try_files /\$duudl_token/page-\$duudl_user.html @duudl_app;
+  }
+
+  location ~ ^/api/duudl/(?<duudl_token>[A-Za-z0-9_-]+)\$ {
+    error_page 418 = @duudl_app;
+    if (!-f $FROZEN_DIR/\$duudl_token/state.json) {
+      return 418;
+    }
+
+    auth_request /_duudl_auth;
+    error_page 401 = @duudl_app;
+
+    root $FROZEN_DIR;
+    default_type application/json;
+    gzip_static on;
+    add_header Cache-Control "private, no-cache";
+    try_files /\$duudl_token/state.json @duudl_app;
+  }
+
+  location / {
+    proxy_pass http://127.0.0.1:$PORT;
+    proxy_set_header Host \$host;
+    proxy_set_header X-Real-IP \$remote_addr;
+    proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto \$scheme;
+  }
+
+  location @duudl_app {
+    proxy_pass http://127.0.0.1:$PORT;
+    proxy_set_header Host \$host;
+    proxy_set_header X-Real-IP \$remote_addr;
+    proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto \$scheme;
+  }
+EOF
+}
 
 write_nginx_http_only() {
   cat <<EOF
@@ -121,13 +201,7 @@ server {
     default_type "text/plain";
   }
 
-  location / {
-    proxy_pass http://127.0.0.1:$PORT;
-    proxy_set_header Host \$host;
-    proxy_set_header X-Real-IP \$remote_addr;
-    proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
-    proxy_set_header X-Forwarded-Proto \$scheme;
-  }
+$(write_nginx_app_locations)
 }
 EOF
 }
@@ -165,13 +239,7 @@ server {
 
   client_max_body_size 2m;
 
-  location / {
-    proxy_pass http://127.0.0.1:$PORT;
-    proxy_set_header Host \$host;
-    proxy_set_header X-Real-IP \$remote_addr;
-    proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
-    proxy_set_header X-Forwarded-Proto \$scheme;
-  }
+$(write_nginx_app_locations)
 }
 EOF
 }